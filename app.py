@@ -1,26 +1,38 @@
 """
 Full app.py — Local RAG Medibot using:
   - Local embeddings: sentence-transformers/all-MiniLM-L6-v2
-  - Vector DB: Pinecone (your existing index, e.g. medibot-rag-d384)
+  - Vector DB: Pinecone (your existing index, e.g. medibot-rag-d384), or a local FAISS HNSW
+    index built by faiss_index.py (VECTOR_BACKEND=faiss)
   - Local LLM: Ollama (HTTP API at http://localhost:11434, model e.g. llama3.1:8b)
 
 Place this file at the root of your project. Ensure:
   - templates/chat.html exists (simple chat UI)
   - .env contains PINECONE_API_KEY and PINECONE_INDEX (and optional PORT/TOP_K)
   - Ollama server is running (ollama serve) and model pulled (ollama pull ...)
-  - Pinecone index already has your embeddings uploaded
+  - Pinecone index already has your embeddings uploaded (or corpus.hnsw exists for FAISS)
 
 Run:
   python app.py
 """
 
+import json
 import os
+import re
+import threading
+import time
 import traceback
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 
-from flask import Flask, render_template, request, jsonify
+import numpy as np
+
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 
 # Pinecone (new package name)
 from pinecone import Pinecone
@@ -33,48 +45,493 @@ load_dotenv()
 # ---------- Config ----------
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX", "medibot-rag-d384")
+# "auto" uses the local FAISS index when FAISS_INDEX_FILE exists and faiss is installed, otherwise Pinecone
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto").strip().lower()
+FAISS_INDEX_FILE = os.getenv("FAISS_INDEX_FILE", "corpus.hnsw")
+FAISS_META_FILE = os.getenv("FAISS_META_FILE", "corpus_meta.jsonl")
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
 TOP_K = int(os.getenv("TOP_K", "5"))
-MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "2500"))
+# context budget in UTF-8 bytes (MAX_CONTEXT_CHARS is still honoured as the default)
+MAX_CONTEXT_BYTES = int(os.getenv("MAX_CONTEXT_BYTES", os.getenv("MAX_CONTEXT_CHARS", "2500")))
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
 PORT = int(os.getenv("PORT", "5000"))
 OLLAMA_TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", "120"))  # seconds
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "1h")  # how long Ollama keeps the model loaded
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+OLLAMA_NUM_BATCH = int(os.getenv("OLLAMA_NUM_BATCH", "512"))
+
+# query embedder backend: "auto" (cuda torch if available, else torch cpu), "torch", or
+# "onnx" (opt-in int8; kept only if it agrees with the fp32 model the corpus was embedded with)
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_EMBED_BACKEND = os.getenv("QUERY_EMBED_BACKEND", "auto").strip().lower()
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", "onnx/all-MiniLM-L6-v2"))
+ONNX_MIN_PARITY = float(os.getenv("ONNX_MIN_PARITY", "0.99"))  # min cosine vs torch on the probe sentences
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))  # recent questions kept embedded
+
+# answer cache: exact question hits skip everything; paraphrases must also
+# retrieve (nearly) the same chunks before a cached answer is reused
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIM = float(os.getenv("ANSWER_CACHE_SIM", "0.95"))  # min cosine between questions
+ANSWER_CACHE_JACCARD = float(os.getenv("ANSWER_CACHE_JACCARD", "0.8"))  # min overlap of retrieved ids
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds an answer stays valid; 0 = no expiry
+
+# retrieval cache: near-identical query vectors share one vector-store result
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+PROXIMITY_TAU = float(os.getenv("PROXIMITY_TAU", "0.97"))  # min cosine to reuse a cached top-k
+RETRIEVAL_WAIT_TIMEOUT = float(os.getenv("RETRIEVAL_WAIT_TIMEOUT", "10"))  # seconds to wait on another request's query
 
 # ---------- Initialize ----------
 app = Flask(__name__, template_folder="templates")
 
-print("Initializing local embedder (all-MiniLM-L6-v2)...")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# one pooled HTTP session for all outbound calls (reuses TCP connections to Ollama)
+http_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+http_session.mount("http://", _adapter)
+http_session.mount("https://", _adapter)
+
+
+class OnnxQueryEmbedder:
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime with graph optimizations and dynamic int8
+    quantization. The exported model is cached in ONNX_MODEL_DIR so the export
+    only happens on the first start. encode() mirrors SentenceTransformer:
+    mean pooling over the attention mask, then L2 normalization.
+    """
+
+    QUANTIZED_FILE = "model_optimized_quantized.onnx"
+    MAX_SEQ_LENGTH = 256  # same as the sentence-transformers config
+
+    def __init__(self, model_id: str, model_dir: Path):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        if not (model_dir / self.QUANTIZED_FILE).exists():
+            self._export(model_id, model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=self.QUANTIZED_FILE)
+
+    @staticmethod
+    def _export(model_id: str, model_dir: Path):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+        from transformers import AutoTokenizer
+
+        print(f"Exporting {model_id} to ONNX (one-time) in {model_dir} ...")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+        optimizer = ORTOptimizer.from_pretrained(model)
+        optimizer.optimize(save_dir=model_dir, optimization_config=OptimizationConfig(optimization_level=2))
+        quantizer = ORTQuantizer.from_pretrained(model_dir, file_name="model_optimized.onnx")
+        quantizer.quantize(
+            save_dir=model_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+        )
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+
+    def encode(self, text: str, **_ignored) -> np.ndarray:
+        tokens = self.tokenizer(text, return_tensors="np", truncation=True, max_length=self.MAX_SEQ_LENGTH)
+        out = self.model(**tokens)
+        hidden = np.asarray(out.last_hidden_state)[0]
+        mask = tokens["attention_mask"][0].astype(np.float32)[:, None]
+        vec = (hidden * mask).sum(axis=0) / max(float(mask.sum()), 1e-9)
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm > 0 else vec).astype(np.float32)
+
+
+# short, long and non-medical probes; the corpus and the Pinecone index were embedded with fp32 torch
+PARITY_PROBES = (
+    "What are the symptoms of type 2 diabetes?",
+    "chest pain radiating to the left arm",
+    "Is it safe to take ibuprofen and paracetamol together for a fever in a child under five years old?",
+    "hello",
+)
+
+
+def onnx_parity(onnx_embedder, reference) -> float:
+    """Lowest cosine between the two embedders over PARITY_PROBES."""
+    ref = reference.encode(list(PARITY_PROBES), convert_to_numpy=True, normalize_embeddings=True)
+    return min(float(onnx_embedder.encode(text) @ ref[i]) for i, text in enumerate(PARITY_PROBES))
+
+
+def load_query_embedder():
+    import torch
+
+    backend = QUERY_EMBED_BACKEND
+    if backend == "auto":
+        backend = "cuda" if torch.cuda.is_available() else "torch"
+    if backend == "cuda":
+        print("Initializing local embedder (all-MiniLM-L6-v2) on CUDA...")
+        return SentenceTransformer("all-MiniLM-L6-v2", device="cuda")
+    print("Initializing local embedder (all-MiniLM-L6-v2)...")
+    reference = SentenceTransformer("all-MiniLM-L6-v2")
+    if backend != "onnx":
+        return reference
+
+    print("Initializing local embedder (all-MiniLM-L6-v2) on ONNX Runtime (int8)...")
+    onnx_embedder = OnnxQueryEmbedder(EMBED_MODEL_ID, ONNX_MODEL_DIR)
+    parity = onnx_parity(onnx_embedder, reference)
+    if parity < ONNX_MIN_PARITY:
+        print(f"ONNX embedder drifts from torch (min cosine {parity:.4f} < {ONNX_MIN_PARITY}); using torch.")
+        return reference
+    print(f"ONNX embedder matches torch (min cosine {parity:.4f}).")
+    return onnx_embedder
+
+
+embedder = load_query_embedder()
+_tokenizer = getattr(embedder, "tokenizer", None)
+if _tokenizer is not None and not getattr(_tokenizer, "is_fast", False):
+    print("WARNING: embedder is using a slow (pure-Python) tokenizer; install `tokenizers` for the fast one.")
 print("Embedder loaded.")
 
-if not PINECONE_API_KEY:
-    raise RuntimeError("PINECONE_API_KEY not set in environment")
+faiss_index = None
+faiss_meta: List[dict] = []
+pinecone_index = None
+
+if VECTOR_BACKEND == "auto":
+    VECTOR_BACKEND = "pinecone"
+    if os.path.exists(FAISS_INDEX_FILE):
+        try:
+            import faiss
+
+            VECTOR_BACKEND = "faiss"
+        except ImportError:
+            print(f"Found {FAISS_INDEX_FILE} but faiss is not installed; using Pinecone.")
+elif VECTOR_BACKEND == "faiss":
+    import faiss
+print(f"Vector backend: {VECTOR_BACKEND} (VECTOR_BACKEND={os.getenv('VECTOR_BACKEND', 'auto')})")
+
+if VECTOR_BACKEND == "faiss":
+    print(f"Loading local FAISS index: {FAISS_INDEX_FILE}")
+    faiss_index = faiss.read_index(FAISS_INDEX_FILE)
+    faiss_index.hnsw.efSearch = FAISS_EF_SEARCH
+    with open(FAISS_META_FILE, "r", encoding="utf-8") as f:
+        faiss_meta = [json.loads(line) for line in f if line.strip()]
+    if len(faiss_meta) != faiss_index.ntotal:
+        raise RuntimeError(f"{FAISS_META_FILE} has {len(faiss_meta)} rows but {FAISS_INDEX_FILE} has {faiss_index.ntotal}")
+    print(f"Loaded FAISS index with {faiss_index.ntotal} vectors")
+else:
+    if not PINECONE_API_KEY:
+        raise RuntimeError("PINECONE_API_KEY not set in environment")
+
+    print("Connecting to Pinecone...")
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+
+    # rename variable to avoid clobbering by route function
+    pinecone_index = pc.Index(PINECONE_INDEX)
+    print(f"Connected to Pinecone index: {PINECONE_INDEX}")
+
+# ---------- Emergency keyword scan ----------
+
+EMERGENCY_KEYWORDS = (
+    "chest pain", "chest tightness", "heart attack", "cardiac arrest",
+    "severe bleeding", "heavy bleeding", "bleeding heavily", "coughing up blood", "vomiting blood",
+    "difficulty breathing", "trouble breathing", "can't breathe", "cannot breathe", "shortness of breath",
+    "choking", "sudden weakness", "slurred speech", "face drooping", "stroke",
+    "unconscious", "passed out", "unresponsive", "seizure", "anaphylaxis", "throat swelling",
+    "overdose", "poisoning", "suicidal", "suicide", "kill myself",
+)
+
+EMERGENCY_PREAMBLE = (
+    "⚠️ This may be a medical emergency. If you or someone else is experiencing these symptoms, "
+    "call your local emergency number (e.g. 911 / 112 / 108) or go to the nearest emergency department now.\n\n"
+)
+
+
+def normalize_for_scan(text: str) -> str:
+    """Lowercase and turn typographic apostrophes into ASCII so "can’t breathe" matches."""
+    return text.lower().replace("\u2019", "'").replace("\u2018", "'")
+
+
+def build_keyword_scanner(keywords):
+    """
+    Return scan(text) -> set of matched keywords. Keywords only match as whole
+    words ("stroke" does not fire on "backstroke"). Uses a single Aho-Corasick
+    automaton (one linear pass for all keywords) when pyahocorasick is installed,
+    otherwise falls back to one word-boundary regex per keyword.
+    """
+    keywords = [normalize_for_scan(kw) for kw in keywords]
+    try:
+        import ahocorasick
+    except ImportError:
+        print("pyahocorasick not installed; using regex search for emergency keywords.")
+        patterns = [(kw, re.compile(r"\b" + re.escape(kw) + r"\b")) for kw in keywords]
+
+        def scan(text: str) -> set:
+            t = normalize_for_scan(text)
+            return {kw for kw, pattern in patterns if pattern.search(t)}
+
+        return scan
+
+    automaton = ahocorasick.Automaton()
+    for kw in keywords:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+
+    def scan(text: str) -> set:
+        t = normalize_for_scan(text)
+        hits = set()
+        for end, kw in automaton.iter(t):
+            start = end - len(kw) + 1
+            if start > 0 and t[start - 1].isalnum():
+                continue
+            if end + 1 < len(t) and t[end + 1].isalnum():
+                continue
+            hits.add(kw)
+        return hits
+
+    return scan
 
-print("Connecting to Pinecone...")
-pc = Pinecone(api_key=PINECONE_API_KEY)
 
-# rename variable to avoid clobbering by route function
-pinecone_index = pc.Index(PINECONE_INDEX)
-print(f"Connected to Pinecone index: {PINECONE_INDEX}")
+find_emergency_keywords = build_keyword_scanner(EMERGENCY_KEYWORDS)
+
+
+def with_emergency_preamble(answer: str, hits: set) -> str:
+    return EMERGENCY_PREAMBLE + answer if hits else answer
+
+
+# ---------- Answer cache ----------
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase and collapse whitespace so trivial variants share a cache key."""
+    return " ".join(question.lower().split())
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    """
+    Two-tier in-memory LRU cache of answers.
+
+    - exact: keyed by the normalized question text.
+    - semantic: nearest cached question by cosine similarity of the query
+      embedding. A semantic hit is only reused if the current retrieval returns
+      mostly the same chunk ids (Jaccard overlap), i.e. the answer is grounded
+      in the same evidence.
+
+    Entries older than ttl seconds (0 = never) are treated as misses and dropped.
+    """
+
+    def __init__(self, max_size: int, min_sim: float, min_jaccard: float, ttl: float = 0):
+        self.max_size = max_size
+        self.min_sim = min_sim
+        self.min_jaccard = min_jaccard
+        self.ttl = ttl
+        self._entries = OrderedDict()  # normalized question -> entry dict
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._vecs: Optional[np.ndarray] = None  # rebuilt lazily after inserts/evictions
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl > 0 and time.time() - entry["ts"] > self.ttl
+
+    def _drop(self, key: str):
+        # caller holds the lock
+        self._entries.pop(key, None)
+        self._vecs = None
+
+    def get_exact(self, question: str) -> Optional[dict]:
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def nearest(self, q_vec) -> Optional[Tuple[dict, float]]:
+        """Return (entry, cosine) for the most similar cached question at or above min_sim."""
+        q = np.asarray(q_vec, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return None
+        q = q / norm
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._vecs is None:
+                # entries hold float16 copies; scan in float32 (numpy float16 matmul is slow)
+                self._keys = list(self._entries.keys())
+                self._vecs = np.stack([self._entries[k]["vec"] for k in self._keys]).astype(np.float32)
+            scores = self._vecs @ q
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.min_sim:
+                return None
+            entry = self._entries.get(self._keys[best])
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._drop(entry["key"])
+                return None
+            return entry, score
+
+    def match_evidence(self, entry: dict, match_ids: set) -> bool:
+        return jaccard(entry["match_ids"], match_ids) >= self.min_jaccard
+
+    def touch(self, entry: dict):
+        with self._lock:
+            if entry["key"] in self._entries:
+                self._entries.move_to_end(entry["key"])
+
+    def put(self, question: str, q_vec, match_ids: set, answer: str, context_preview: str):
+        if not answer or not answer.strip():
+            return
+        key = normalize_question(question)
+        vec = np.asarray(q_vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        entry = {
+            "key": key,
+            "q": question,
+            "vec": vec.astype(np.float16),
+            "match_ids": set(match_ids),
+            "answer": answer,
+            "context_preview": context_preview,
+            "ts": time.time(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._vecs = None
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_SIM, ANSWER_CACHE_JACCARD, ANSWER_CACHE_TTL)
+
+
+class RetrievalCache:
+    """
+    LRU cache of vector-store results (Pinecone or FAISS) for nearby query
+    vectors. A lookup scans every cached unit vector with the same top_k and
+    reuses the closest one if its cosine is >= tau (4096 x 384 float32 is well
+    under a millisecond). The corpus is static between re-ingests, so cached
+    matches stay valid for the process lifetime.
+    """
+
+    def __init__(self, max_size: int, tau: float):
+        self.max_size = max_size
+        self.tau = tau
+        self._entries = OrderedDict()  # entry id -> (top_k, float16 unit vec, matches)
+        self._next_id = 0
+        self._ids: List[int] = []
+        self._vecs: Optional[np.ndarray] = None  # rebuilt lazily after inserts/evictions
+        self._top_ks: Optional[np.ndarray] = None
+        self._inflight: List[Tuple[int, np.ndarray, Future]] = []  # (top_k, unit vec, future) per query already sent
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        q = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def _nearest(self, q: np.ndarray, top_k: int) -> Optional[int]:
+        # caller holds the lock; returns the id of the closest entry at or above tau
+        if not self._entries:
+            return None
+        if self._vecs is None:
+            # entries hold float16 copies; scan in float32 (numpy float16 matmul is slow)
+            self._ids = list(self._entries.keys())
+            self._vecs = np.stack([self._entries[i][1] for i in self._ids]).astype(np.float32)
+            self._top_ks = np.array([self._entries[i][0] for i in self._ids])
+        scores = np.where(self._top_ks == top_k, self._vecs @ q, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] < self.tau:
+            return None
+        return self._ids[best]
+
+    def get(self, vec, top_k: int):
+        q = self._unit(vec)
+        with self._lock:
+            entry_id = self._nearest(q, top_k)
+            if entry_id is None:
+                return None
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id][2]
+
+    def put(self, vec, top_k: int, matches):
+        q = self._unit(vec)
+        with self._lock:
+            # replace a neighbour that already covers this vector instead of stacking duplicates
+            entry_id = self._nearest(q, top_k)
+            if entry_id is None:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._entries[entry_id] = (top_k, q.astype(np.float16), matches)
+            self._entries.move_to_end(entry_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._vecs = None
+
+    def claim(self, vec, top_k: int) -> Tuple[Future, bool]:
+        """
+        Coalesce concurrent misses. Returns (future, is_leader):
+        - another request already querying a vector within tau -> (its future, False)
+        - otherwise -> (new future, True); the caller must query the vector store and finish(...) it
+        """
+        q = self._unit(vec)
+        with self._lock:
+            best, best_score = None, self.tau
+            for running_k, running_vec, running_fut in self._inflight:
+                if running_k != top_k:
+                    continue
+                score = float(running_vec @ q)
+                if score >= best_score:
+                    best, best_score = running_fut, score
+            if best is not None:
+                return best, False
+            fut = Future()
+            self._inflight.append((top_k, q, fut))
+            return fut, True
+
+    def finish(self, fut: Future, matches=None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight = [item for item in self._inflight if item[2] is not fut]
+        if matches is not None:
+            fut.set_result(matches)
+        elif isinstance(error, Exception):
+            fut.set_exception(error)
+        else:
+            # KeyboardInterrupt/SystemExit etc. belong to the leader's thread only
+            fut.set_exception(RuntimeError("retrieval interrupted"))
+
+
+retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE, PROXIMITY_TAU)
 
 # ---------- Utility functions ----------
 
 
-def embed_query_local(text: str) -> List[float]:
-    """Return 1-D list float vector for a query string."""
-    vec = embedder.encode(text, show_progress_bar=False)
-    try:
-        return vec.tolist()
-    except Exception:
-        return [float(x) for x in vec]
+@lru_cache(maxsize=QUERY_EMBED_CACHE_SIZE)
+def _encode_cached(text: str) -> np.ndarray:
+    vec = embedder.encode(text, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True)
+    vec = vec.astype(np.float32, copy=False)
+    vec.setflags(write=False)  # shared between callers via the cache
+    return vec
 
 
-def query_pinecone(vec: List[float], top_k: int = TOP_K):
+def embed_query_local(text: str) -> np.ndarray:
+    """Return a 1-D L2-normalized float32 numpy vector for a query string (read-only, cached)."""
+    return _encode_cached(text)
+
+
+def query_pinecone(vec, top_k: int = TOP_K):
     """
     Query Pinecone and return normalized list of matches.
     Each match is normalized to a dict with keys: id, score, metadata.
     """
-    res = pinecone_index.query(vector=vec, top_k=top_k, include_metadata=True)
+    # Pinecone wants a plain list of floats; convert only at the wire boundary
+    values = np.asarray(vec, dtype=np.float32).tolist()
+    res = pinecone_index.query(vector=values, top_k=top_k, include_metadata=True)
     matches = []
     # support both dict and object-style responses across SDK versions
     if isinstance(res, dict):
@@ -107,13 +564,64 @@ def query_pinecone(vec: List[float], top_k: int = TOP_K):
     return matches
 
 
-def build_context_from_matches(matches, max_chars: int = MAX_CONTEXT_CHARS) -> str:
+def query_faiss(vec, top_k: int = TOP_K):
+    """Search the local HNSW index; returns matches in the same shape as query_pinecone."""
+    q = np.array(vec, dtype=np.float32).reshape(1, -1)  # copy: vec may be a read-only cached array
+    faiss.normalize_L2(q)
+    scores, rows = faiss_index.search(q, top_k)
+    matches = []
+    for score, row in zip(scores[0], rows[0]):
+        if row < 0:  # fewer than top_k results
+            continue
+        item = faiss_meta[row]
+        matches.append({"id": item.get("id"), "score": float(score), "metadata": item.get("metadata", {})})
+    return matches
+
+
+def query_vectors(vec, top_k: int = TOP_K):
+    if faiss_index is not None:
+        return query_faiss(vec, top_k=top_k)
+    return query_pinecone(vec, top_k=top_k)
+
+
+def retrieve(vec, top_k: int = TOP_K):
+    """
+    query_vectors (Pinecone or FAISS) with the retrieval cache in front of it.
+    Concurrent requests for the same neighborhood share a single in-flight query.
+    """
+    matches = retrieval_cache.get(vec, top_k)
+    if matches is not None:
+        return matches
+
+    fut, leader = retrieval_cache.claim(vec, top_k)
+    if not leader:
+        try:
+            return fut.result(timeout=RETRIEVAL_WAIT_TIMEOUT)
+        except FutureTimeout:
+            print(f"Waited {RETRIEVAL_WAIT_TIMEOUT}s on a shared query; querying directly.")
+            return query_vectors(vec, top_k=top_k)
+
+    matches = None
+    error = None
+    try:
+        matches = query_vectors(vec, top_k=top_k)
+        retrieval_cache.put(vec, top_k, matches)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # always release waiters and the in-flight slot, whatever interrupted us
+        retrieval_cache.finish(fut, matches=matches, error=error)
+    return matches
+
+
+def build_context_from_matches(matches, max_bytes: int = MAX_CONTEXT_BYTES) -> str:
     """
     Build a concatenated context string from the top matches' metadata.
     Looks for 'preview' or 'text' fields in metadata.
+    Stops once max_bytes of UTF-8 have been collected.
     """
-    parts = []
-    total = 0
+    buf = bytearray()
     for m in matches:
         meta = m.get("metadata", {}) or {}
         preview = ""
@@ -131,50 +639,136 @@ def build_context_from_matches(matches, max_chars: int = MAX_CONTEXT_CHARS) -> s
         if not preview:
             continue
 
-        if total + len(preview) > max_chars:
-            allowed = max_chars - total
-            parts.append(preview[:allowed])
+        piece = (preview + "\n\n").encode("utf-8")
+        buf.extend(piece[: max_bytes - len(buf)])
+        if len(buf) >= max_bytes:
             break
 
-        parts.append(preview)
-        total += len(preview)
-
-    return "\n\n".join(parts).strip()
+    # a cut in the middle of a multi-byte character is dropped by "ignore"
+    return buf.decode("utf-8", "ignore").strip()
 
 
-def generate_answer_ollama(context: str, question: str) -> str:
+def ollama_options() -> dict:
     """
-    Call local Ollama HTTP API. If Ollama call fails, return an extractive fallback.
+    Model options sent with every Ollama request. Keeping these identical across
+    calls (and with the warm-up) stops Ollama from reloading the model.
     """
-    system_text = (
-        "You are Medibot, a medically-informed assistant. You MUST NOT provide definitive diagnoses. "
-        "Always recommend consulting a qualified healthcare professional. "
-        "If the user describes an emergency (chest pain, severe bleeding, difficulty breathing, sudden weakness or slurred speech), instruct them to call emergency services immediately."
-    )
+    return {"num_ctx": OLLAMA_NUM_CTX, "num_batch": OLLAMA_NUM_BATCH}
+
+
+def warmup_ollama():
+    """Load the model into Ollama ahead of the first /ask (empty prompt = load only)."""
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": "",
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": ollama_options(),
+    }
+    try:
+        resp = http_session.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT)
+        resp.raise_for_status()
+        print(f"Ollama model warmed up: {OLLAMA_MODEL}")
+    except Exception as e:
+        print("Ollama warm-up failed; the first request will load the model instead:", repr(e))
+
+
+# Sent as Ollama's "system" field, apart from the per-request CONTEXT/QUESTION.
+# Keep it byte-identical (no interpolation) so the runner keeps reusing its KV
+# cache for this prefix.
+SYSTEM_PROMPT = (
+    "You are Medibot, a medically-informed assistant. You MUST NOT provide definitive diagnoses. "
+    "Always recommend consulting a qualified healthcare professional. "
+    "If the user describes an emergency (chest pain, severe bleeding, difficulty breathing, sudden weakness or slurred speech), instruct them to call emergency services immediately."
+)
 
-    prompt = (
-        f"{system_text}\n\n"
+
+def build_prompt(context: str, question: str) -> str:
+    """User prompt only; the fixed preamble travels separately as SYSTEM_PROMPT."""
+    return (
         f"CONTEXT:\n{context}\n\n"
         f"QUESTION:\n{question}\n\n"
         "Using ONLY the context above and general medical knowledge, answer concisely and safely. If the context is insufficient, say so and recommend seeing a doctor."
     )
 
-    payload = {
+
+def ollama_payload(context: str, question: str, stream: bool) -> dict:
+    return {
         "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
+        "system": SYSTEM_PROMPT,
+        "prompt": build_prompt(context, question),
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": ollama_options(),
     }
 
+
+def generate_answer_ollama(context: str, question: str) -> Tuple[str, bool]:
+    """
+    Call local Ollama HTTP API. If Ollama call fails, return an extractive fallback.
+    Returns (answer, ok) where ok is False when the fallback was used; only a
+    non-empty "response" counts as success.
+    """
+    payload = ollama_payload(context, question, stream=False)
+
     try:
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT)
+        resp = http_session.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT)
         resp.raise_for_status()
         j = resp.json()
-        if isinstance(j, dict) and "response" in j:
-            return j.get("response", "").strip()
-        return str(j)
+        if not isinstance(j, dict):
+            raise ValueError(f"unexpected Ollama response: {str(j)[:200]}")
+        if j.get("error"):
+            raise RuntimeError(f"Ollama error: {j['error']}")
+        answer = (j.get("response") or "").strip()
+        if not answer:
+            raise ValueError("Ollama returned an empty response")
+        return answer, True
     except Exception as e:
         print("Ollama call failed:", repr(e))
-        return ollama_fallback_extractive(context, note_error=str(e))
+        return ollama_fallback_extractive(context, note_error=str(e)), False
+
+
+def stream_answer_ollama(context: str, question: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Stream the answer from Ollama as it is generated.
+    Yields (text, ok) pieces. Every piece has ok=True only if the stream produced
+    text and ended with "done": true. If Ollama fails before producing anything
+    (including an {"error": ...} line or an empty answer), yields the extractive
+    fallback once with ok=False. A failure mid-stream, or a stream that stops
+    without "done", yields a short notice with ok=False so the partial answer is
+    not cached.
+    """
+    payload = ollama_payload(context, question, stream=True)
+    produced = False
+    try:
+        with http_session.post(OLLAMA_URL, json=payload, timeout=OLLAMA_TIMEOUT, stream=True) as resp:
+            resp.raise_for_status()
+            # Ollama streams one JSON object per line: {"response": "...", "done": false};
+            # a runner failure arrives as {"error": "..."} on the same HTTP 200 stream
+            done = False
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                j = json.loads(line)
+                if j.get("error"):
+                    raise RuntimeError(f"Ollama error: {j['error']}")
+                token = j.get("response", "")
+                if token:
+                    produced = True
+                    yield token, True
+                if j.get("done"):
+                    done = True
+                    break
+            if not done:
+                raise ConnectionError("Ollama stream ended before done")
+            if not produced:
+                raise ValueError("Ollama returned an empty response")
+    except Exception as e:
+        print("Ollama streaming call failed:", repr(e))
+        if produced:
+            yield "\n\n[answer interrupted: the local language model stopped responding]", False
+        else:
+            yield ollama_fallback_extractive(context, note_error=str(e)), False
 
 
 def ollama_fallback_extractive(context: str, note_error: str = "") -> str:
@@ -201,6 +795,12 @@ def ollama_fallback_extractive(context: str, note_error: str = "") -> str:
     return fallback
 
 
+# In a daemon thread so startup does not wait on the model load. Under the debug
+# reloader the parent process only watches files, so only the child warms up.
+if __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    print("Warming up Ollama model in the background...")
+    threading.Thread(target=warmup_ollama, name="ollama-warmup", daemon=True).start()
+
 # ---------- Flask routes ----------
 @app.route("/")
 def home():
@@ -210,6 +810,34 @@ def home():
         return "<h3>Medibot RAG</h3><p>UI not found. Create templates/chat.html or use /ask endpoint.</p>"
 
 
+def lookup_or_retrieve(question: str):
+    """
+    Answer-cache lookups plus retrieval for one question.
+    Returns (entry, None) on a cache hit, otherwise
+    (None, (q_vec, match_ids, context, preview)) ready for the LLM.
+    """
+    cached = answer_cache.get_exact(question)
+    if cached is not None:
+        return cached, None
+
+    q_vec = embed_query_local(question)
+    near = answer_cache.nearest(q_vec)
+    matches = retrieve(q_vec, top_k=TOP_K)
+    match_ids = {m.get("id") for m in matches if m.get("id")}
+    if near is not None and answer_cache.match_evidence(near[0], match_ids):
+        entry = near[0]
+        answer_cache.touch(entry)
+        return entry, None
+
+    context = build_context_from_matches(matches, max_bytes=MAX_CONTEXT_BYTES)
+    preview = context[:1000] + ("..." if len(context) > 1000 else "")
+    return None, (q_vec, match_ids, context, preview)
+
+
+def sse(obj: dict) -> str:
+    return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
 @app.route("/ask", methods=["POST"])
 def ask():
     """
@@ -222,23 +850,80 @@ def ask():
         return jsonify({"error": "empty question"}), 400
 
     try:
-        q_vec = embed_query_local(question)
-        matches = query_pinecone(q_vec, top_k=TOP_K)
-        context = build_context_from_matches(matches, max_chars=MAX_CONTEXT_CHARS)
-        answer = generate_answer_ollama(context, question)
-        preview = context[:1000] + ("..." if len(context) > 1000 else "")
-        return jsonify({"answer": answer, "context_preview": preview})
+        # red-flag symptoms get the emergency notice regardless of what the LLM says
+        hits = find_emergency_keywords(question)
+
+        entry, state = lookup_or_retrieve(question)
+        if entry is not None:
+            return jsonify({"answer": with_emergency_preamble(entry["answer"], hits), "context_preview": entry["context_preview"]})
+
+        q_vec, match_ids, context, preview = state
+        answer, ok = generate_answer_ollama(context, question)
+        if ok:
+            answer_cache.put(question, q_vec, match_ids, answer, preview)
+        return jsonify({"answer": with_emergency_preamble(answer, hits), "context_preview": preview})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """
+    Same body as /ask. Responds with Server-Sent Events:
+      data: {"token": "..."}                       (repeated, answer text as it is generated)
+      data: {"done": true, "context_preview": "..."}
+      data: {"error": "..."}                       (instead of done, on failure)
+    """
+    data = request.get_json(force=True)
+    question = (data.get("question") or "").strip()
+    if not question:
+        return jsonify({"error": "empty question"}), 400
+
+    hits = find_emergency_keywords(question)
+    try:
+        entry, state = lookup_or_retrieve(question)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+    def events():
+        if hits:
+            yield sse({"token": EMERGENCY_PREAMBLE})
+        if entry is not None:
+            yield sse({"token": entry["answer"]})
+            yield sse({"done": True, "context_preview": entry["context_preview"]})
+            return
+
+        q_vec, match_ids, context, preview = state
+        parts = []
+        ok = True
+        try:
+            for token, token_ok in stream_answer_ollama(context, question):
+                ok = ok and token_ok
+                parts.append(token)
+                yield sse({"token": token})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse({"error": str(e)})
+            return
+        answer = "".join(parts).strip()
+        if ok and answer:
+            answer_cache.put(question, q_vec, match_ids, answer, preview)
+        yield sse({"done": True, "context_preview": preview})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
 
 @app.route("/health")
 def health():
-    return {"status": "ok", "index": PINECONE_INDEX}
+    index = FAISS_INDEX_FILE if VECTOR_BACKEND == "faiss" else PINECONE_INDEX
+    return {"status": "ok", "backend": VECTOR_BACKEND, "index": index}
 
 
 # ---------- Run ----------
 if __name__ == "__main__":
-    print(f"Starting Medibot (Pinecone index: {PINECONE_INDEX}) on port {PORT}")
+    index_desc = f"FAISS index: {FAISS_INDEX_FILE}" if VECTOR_BACKEND == "faiss" else f"Pinecone index: {PINECONE_INDEX}"
+    print(f"Starting Medibot ({index_desc}) on port {PORT}")
     app.run(host="0.0.0.0", port=PORT, debug=True)
@@ -1,22 +1,35 @@
 # embed_texts_groq.py
 """
-Reads chunks.jsonl and produces embeddings.jsonl using Groq (preferred) or local sentence-transformers fallback.
-Outputs lines:
+Reads chunks.jsonl and produces embeddings using Groq (preferred) or local sentence-transformers fallback.
+EMBED_BACKEND=ollama uses a local Ollama server's batch /api/embed endpoint instead.
+Outputs embeddings.npy (N x dim matrix, dtype EMBED_NPY_DTYPE, float32 by default) plus
+ids.jsonl with one row-aligned line per vector:
+{"id": "...", "metadata": {...}}
+
+With EMBED_FORMAT=jsonl it instead writes embeddings.jsonl lines:
 {"id": "...", "embedding": [...], "metadata": {...}}
 """
 
 import os
 import time
-import json
+import asyncio
+import orjson
 from pathlib import Path
 from dotenv import load_dotenv
-import requests
+import numpy as np
+import httpx
 from tqdm import tqdm
 
 load_dotenv()
 
 CHUNKS_FILE = Path("chunks.jsonl")
 OUT_FILE = Path("embeddings.jsonl")
+OUT_NPY = Path("embeddings.npy")
+OUT_IDS = Path("ids.jsonl")
+EMBED_FORMAT = os.getenv("EMBED_FORMAT", "npy").strip().lower()  # "npy" or "jsonl"
+EMBED_NPY_DTYPE = os.getenv("EMBED_NPY_DTYPE", "float32").strip()
+# one record per line; numpy embedding rows are serialized directly (no .tolist())
+JSONL_OPTS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
 
 # Groq config
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "").strip()
@@ -24,12 +37,23 @@ GROQ_MODEL = os.getenv("GROQ_MODEL", "embed-english-v1").strip()
 GROQ_EMBED_URL = "https://api.groq.ai/v1/embeddings"
 
 # Tunables
-BATCH_SLEEP = float(os.getenv("BATCH_SLEEP", "0.08"))
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))  # max in-flight Groq requests
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "60"))
 
+# Ollama config (EMBED_BACKEND=ollama); all-minilm is the same 384-d MiniLM model
+# (not OLLAMA_HOST: the Ollama server/CLI read that as a bind address, usually without a scheme)
+OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embed").strip()
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "all-minilm").strip()
+
+# Backend: "auto" (Groq if GROQ_API_KEY is set, else local), "groq", "local" or "ollama"
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "auto").strip().lower()
+if EMBED_BACKEND == "auto":
+    EMBED_BACKEND = "groq" if GROQ_API_KEY else "local"
+
 # Local fallback
-USE_LOCAL_FALLBACK = not bool(GROQ_API_KEY)
+USE_LOCAL_FALLBACK = EMBED_BACKEND == "local"
 
 # Try to import sentence-transformers only if needed
 local_embedder = None
@@ -42,60 +66,150 @@ if USE_LOCAL_FALLBACK:
         print("Install sentence-transformers and torch or set GROQ_API_KEY in .env to use Groq.")
         raise
 
-def groq_embed_one(text):
-    """
-    Call Groq embeddings endpoint for a single text.
-    Returns list[float].
-    """
-    headers = {
+def groq_headers():
+    return {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json",
     }
+
+def parse_groq_embedding(data):
+    # Groq typical response: {"data":[{"embedding":[...], "index":0}], ...}
+    if "data" in data and isinstance(data["data"], list) and len(data["data"])>0:
+        emb = data["data"][0].get("embedding") or data["data"][0]
+        return emb
+    # if direct top-level
+    if "embedding" in data:
+        return data["embedding"]
+    raise ValueError("Unexpected Groq embedding response: " + str(data)[:1000])
+
+def retry_backoff(attempt, e, label):
+    """
+    Shared retry policy for the HTTP embedding backends. Returns the seconds to
+    wait before the next attempt, or re-raises e when it should not be retried
+    (client errors other than 429, or MAX_RETRIES reached).
+    """
+    status = None
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        if 400 <= status < 500 and status != 429:
+            # client errors: do not retry forever
+            raise e
+    if attempt >= MAX_RETRIES:
+        raise e
+    backoff = 2 ** attempt
+    if status is not None:
+        print(f"[{label}] transient HTTP error ({status}), retrying in {backoff}s...")
+    else:
+        print(f"[{label}] transient error: {e}. retrying in {backoff}s...")
+    return backoff
+
+async def groq_embed_one_async(client, sem, text, cid=None, pbar=None):
+    """
+    Call Groq embeddings endpoint for a single text on a shared httpx.AsyncClient.
+    The semaphore bounds how many requests are in flight (this replaces BATCH_SLEEP).
+    Returns list[float].
+    """
     payload = {
         "model": GROQ_MODEL,
         "input": text
     }
     attempt = 0
+    async with sem:
+        while True:
+            attempt += 1
+            try:
+                r = await client.post(GROQ_EMBED_URL, json=payload)
+                if r.status_code != 200:
+                    print(f"[groq] status={r.status_code} body={r.text[:1000]}")
+                r.raise_for_status()
+                emb = parse_groq_embedding(r.json())
+                if pbar is not None:
+                    pbar.update(1)
+                return emb
+            except Exception as e:
+                try:
+                    backoff = retry_backoff(attempt, e, "groq")
+                except Exception:
+                    print(f"❌ Failed to embed id={cid}: {e}")
+                    raise
+                await asyncio.sleep(backoff)
+
+async def groq_embed_all(texts, ids=None):
+    """
+    Embed all texts concurrently over one pooled HTTP/2 connection set.
+    Returns list[list[float]] in input order.
+    """
+    ids = ids or [None] * len(texts)
+    limits = httpx.Limits(max_keepalive_connections=16, max_connections=max(16, GROQ_CONCURRENCY))
+    sem = asyncio.Semaphore(GROQ_CONCURRENCY)
+    async with httpx.AsyncClient(http2=True, timeout=REQUEST_TIMEOUT, limits=limits, headers=groq_headers()) as client:
+        with tqdm(total=len(texts), desc="Embedding chunks", unit="chunk") as pbar:
+            return await asyncio.gather(*[
+                groq_embed_one_async(client, sem, t, cid, pbar) for t, cid in zip(texts, ids)
+            ])
+
+def groq_embed_one(text):
+    """
+    Call Groq embeddings endpoint for a single text.
+    Returns list[float].
+    """
+    return asyncio.run(groq_embed_all([text]))[0]
+
+def ollama_embed_batch(texts, client=None):
+    """
+    Embed many texts with one POST to Ollama's /api/embed ({"input": [t1, ..., tN]}).
+    Retries transient failures with the same backoff as the Groq path.
+    Returns list[list[float]] in input order.
+    """
+    if client is None:
+        with httpx.Client(timeout=REQUEST_TIMEOUT) as c:
+            return ollama_embed_batch(texts, c)
+
+    payload = {"model": OLLAMA_EMBED_MODEL, "input": list(texts)}
+    attempt = 0
     while True:
         attempt += 1
         try:
-            r = requests.post(GROQ_EMBED_URL, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+            r = client.post(OLLAMA_EMBED_URL, json=payload)
             if r.status_code != 200:
-                print(f"[groq] status={r.status_code} body={r.text[:1000]}")
+                print(f"[ollama] status={r.status_code} body={r.text[:1000]}")
             r.raise_for_status()
-            data = r.json()
-            # Groq typical response: {"data":[{"embedding":[...], "index":0}], ...}
-            if "data" in data and isinstance(data["data"], list) and len(data["data"])>0:
-                emb = data["data"][0].get("embedding") or data["data"][0]
-                return emb
-            # if direct top-level
-            if "embedding" in data:
-                return data["embedding"]
-            raise ValueError("Unexpected Groq embedding response: " + str(data)[:1000])
-        except requests.HTTPError as he:
-            status = getattr(he.response, "status_code", None)
-            if status and 400 <= status < 500:
-                # client errors: do not retry forever
-                raise
-            if attempt >= MAX_RETRIES:
-                raise
-            backoff = 2 ** attempt
-            print(f"[groq] transient HTTP error, retrying in {backoff}s...")
-            time.sleep(backoff)
+            return r.json()["embeddings"]
         except Exception as e:
-            if attempt >= MAX_RETRIES:
-                raise
-            backoff = 2 ** attempt
-            print(f"[groq] transient error: {e}. retrying in {backoff}s...")
+            backoff = retry_backoff(attempt, e, "ollama")
             time.sleep(backoff)
 
+def ollama_embed_all(texts):
+    """Embed all texts in EMBED_BATCH-sized /api/embed calls over one keep-alive connection."""
+    embs = []
+    with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
+        for i in tqdm(range(0, len(texts), EMBED_BATCH), desc="Embedding batches", unit="batch"):
+            embs.extend(ollama_embed_batch(texts[i:i + EMBED_BATCH], client))
+    return embs
+
+def local_embed_batch(texts):
+    """
+    Use sentence-transformers model to embed many texts in one encode() call.
+    SBERT sorts by length and pads per batch, so this is much faster than
+    encoding one text at a time.
+    Returns numpy array of shape (len(texts), dim).
+    """
+    global local_embedder
+    return local_embedder.encode(
+        texts,
+        batch_size=EMBED_BATCH,
+        show_progress_bar=True,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+
 def local_embed_one(text):
     """
     Use sentence-transformers model to embed one text.
     Returns list[float].
     """
     global local_embedder
-    emb = local_embedder.encode(text, show_progress_bar=False)
+    emb = local_embedder.encode(text, show_progress_bar=False, normalize_embeddings=True)
     # convert numpy to python list if necessary
     try:
         return emb.tolist()
@@ -103,6 +217,8 @@ def local_embed_one(text):
         return list(map(float, emb))
 
 def embed_text(text):
+    if EMBED_BACKEND == "ollama":
+        return ollama_embed_batch([text])[0]
     if not USE_LOCAL_FALLBACK:
         return groq_embed_one(text)
     else:
@@ -115,13 +231,13 @@ def main():
 
     # read chunks
     chunks = []
-    with CHUNKS_FILE.open("r", encoding="utf-8") as fh:
+    with CHUNKS_FILE.open("rb") as fh:
         for line in fh:
             line = line.strip()
             if not line:
                 continue
             try:
-                chunks.append(json.loads(line))
+                chunks.append(orjson.loads(line))
             except Exception as e:
                 print("Skipping malformed line:", e)
 
@@ -131,31 +247,56 @@ def main():
         return
 
     # If Groq selected, test a quick call first (to fail early)
-    if not USE_LOCAL_FALLBACK:
+    if EMBED_BACKEND == "ollama":
+        print(f"Using Ollama embeddings ({OLLAMA_EMBED_URL}) with model:", OLLAMA_EMBED_MODEL)
+    elif not USE_LOCAL_FALLBACK:
         print("Using Groq embeddings with model:", GROQ_MODEL)
     else:
         print("Using local sentence-transformers fallback: all-MiniLM-L6-v2")
 
+    # Embed everything up front: batched encode() calls locally, concurrent requests for Groq
+    texts = [c["text"] for c in chunks]
+    if USE_LOCAL_FALLBACK:
+        embs = local_embed_batch(texts)
+    elif EMBED_BACKEND == "ollama":
+        embs = ollama_embed_all(texts)
+    else:
+        ids = [chunk_id_and_metadata(c, i)[0] for i, c in enumerate(chunks, start=1)]
+        embs = asyncio.run(groq_embed_all(texts, ids))
+
+    if EMBED_FORMAT == "jsonl":
+        write_jsonl(chunks, embs)
+    else:
+        write_npy(chunks, embs)
+
+def chunk_id_and_metadata(c, i):
+    cid = c.get("id") or f"chunk_{i}"
+    metadata = {
+        "source": c.get("source"),
+        "page": c.get("page"),
+        "chunk_id": c.get("chunk_id"),
+        "preview": c.get("text")[:300]
+    }
+    return cid, metadata
+
+def write_jsonl(chunks, embs):
     # Write output; overwrite to start fresh
-    with OUT_FILE.open("w", encoding="utf-8") as outfh:
-        for i, c in enumerate(tqdm(chunks, desc="Embedding chunks", unit="chunk"), start=1):
-            cid = c.get("id") or f"chunk_{i}"
-            try:
-                emb = embed_text(c["text"])
-            except Exception as e:
-                print(f"❌ Failed to embed id={cid}: {e}")
-                raise
-            metadata = {
-                "source": c.get("source"),
-                "page": c.get("page"),
-                "chunk_id": c.get("chunk_id"),
-                "preview": c.get("text")[:300]
-            }
-            out = {"id": cid, "embedding": emb, "metadata": metadata}
-            outfh.write(json.dumps(out, ensure_ascii=False) + "\n")
-            time.sleep(BATCH_SLEEP)
+    with OUT_FILE.open("wb") as outfh:
+        for i, c in enumerate(tqdm(chunks, desc="Writing embeddings", unit="chunk"), start=1):
+            cid, metadata = chunk_id_and_metadata(c, i)
+            out = {"id": cid, "embedding": embs[i - 1], "metadata": metadata}
+            outfh.write(orjson.dumps(out, option=JSONL_OPTS))
 
     print("Wrote", OUT_FILE)
 
+def write_npy(chunks, embs):
+    with OUT_IDS.open("wb") as idfh:
+        for i, c in enumerate(tqdm(chunks, desc="Writing embeddings", unit="chunk"), start=1):
+            cid, metadata = chunk_id_and_metadata(c, i)
+            idfh.write(orjson.dumps({"id": cid, "metadata": metadata}, option=JSONL_OPTS))
+
+    np.save(OUT_NPY, np.asarray(embs, dtype=EMBED_NPY_DTYPE))
+    print("Wrote", OUT_NPY, "and", OUT_IDS)
+
 if __name__ == "__main__":
     main()
@@ -1,76 +1,125 @@
 # extract_texts.py
-import os, json, time
+import os, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
 from pathlib import Path
 from dotenv import load_dotenv
 import fitz  # pymupdf
-from pdf2image import convert_from_path
+from PIL import Image
 import pytesseract
+import orjson
 
 load_dotenv()
 
 PDF_DIR = Path("pdfs")
 OUT_FILE = Path("chunks.jsonl")
 
-POPPLER_PATH = os.getenv("POPPLER_PATH", "")
 CHUNK_SIZE_WORDS = int(os.getenv("CHUNK_SIZE_WORDS", "300"))
 CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "50"))
 OCR_THRESHOLD_CHARS = 60
 PDF_DPI_FOR_OCR = 200
+TESSERACT_CONFIG = os.getenv("TESSERACT_CONFIG", "--oem 1 --psm 6")  # LSTM engine, single text block
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or os.cpu_count()
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "16"))
 
-def extract_chunks_from_pdf_mupdf(pdf_path: str, chunk_size=CHUNK_SIZE_WORDS, overlap=CHUNK_OVERLAP_WORDS):
-    doc = fitz.open(pdf_path)
+def ocr_page(pdf_path: str, page) -> str:
+    # rasterize with PyMuPDF in-process instead of launching poppler per page
+    page_index = page.number
+    try:
+        pix = page.get_pixmap(dpi=PDF_DPI_FOR_OCR, alpha=False)
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        return pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+    except Exception as e:
+        print(f"⚠️ OCR fallback failed for {pdf_path} page {page_index+1}: {e}")
+    return ""
+
+def chunk_page_text(pdf_path: str, page_index: int, text: str, chunk_size=CHUNK_SIZE_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    words = text.split()
+    n = len(words)
+    step = chunk_size - overlap
+    chunks = []
+    if n == 0:
+        return chunks
+    # join once, then slice windows out of it by word start offsets
+    # (starts[k] = index of word k in `joined`; starts[n] = len(joined) + 1)
+    joined = " ".join(words)
+    starts = [0]
+    starts.extend(accumulate(len(w) + 1 for w in words))
+    i = 0
+    chunk_id = 0
+    while i < n:
+        end = min(i + chunk_size, n)
+        chunk_text = joined[starts[i]:starts[end] - 1]
+        if chunk_text:
+            chunks.append({
+                "id": f"{Path(pdf_path).stem}_p{page_index+1}_c{chunk_id}",
+                "source": Path(pdf_path).name,
+                "page": page_index + 1,
+                "chunk_id": chunk_id,
+                "text": chunk_text
+            })
+        chunk_id += 1
+        i += step
+    return chunks
+
+def extract_chunks_from_pages(task, chunk_size=CHUNK_SIZE_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    """
+    Worker entry point. task = (pdf_path, first_page_index, last_page_index_exclusive).
+    Opens its own fitz document so nothing unpicklable crosses the process boundary.
+    """
+    pdf_path, start, stop = task
     chunks = []
-    for page_index in range(len(doc)):
-        page = doc.load_page(page_index)
-        text = page.get_text("text") or ""
-        if len(text.strip()) < OCR_THRESHOLD_CHARS:
-            try:
-                if POPPLER_PATH:
-                    pil_images = convert_from_path(pdf_path, first_page=page_index+1, last_page=page_index+1, dpi=PDF_DPI_FOR_OCR, poppler_path=POPPLER_PATH)
-                else:
-                    pil_images = convert_from_path(pdf_path, first_page=page_index+1, last_page=page_index+1, dpi=PDF_DPI_FOR_OCR)
-                if pil_images:
-                    img = pil_images[0]
-                    text = pytesseract.image_to_string(img)
-            except Exception as e:
-                print(f"⚠️ OCR fallback failed for {pdf_path} page {page_index+1}: {e}")
-                text = ""
-        if not text.strip():
-            continue
-        words = text.split()
-        i = 0
-        chunk_id = 0
-        while i < len(words):
-            end = i + chunk_size
-            chunk_text = " ".join(words[i:end]).strip()
-            if chunk_text:
-                chunks.append({
-                    "id": f"{Path(pdf_path).stem}_p{page_index+1}_c{chunk_id}",
-                    "source": Path(pdf_path).name,
-                    "page": page_index + 1,
-                    "chunk_id": chunk_id,
-                    "text": chunk_text
-                })
-            chunk_id += 1
-            i += (chunk_size - overlap)
-    doc.close()
+    doc = fitz.open(pdf_path)
+    try:
+        for page_index in range(start, stop):
+            page = doc.load_page(page_index)
+            text = page.get_text("text") or ""
+            if len(text.strip()) < OCR_THRESHOLD_CHARS:
+                text = ocr_page(pdf_path, page)
+            if not text.strip():
+                continue
+            chunks.extend(chunk_page_text(pdf_path, page_index, text, chunk_size, overlap))
+    finally:
+        doc.close()
     return chunks
 
+def extract_chunks_from_pdf_mupdf(pdf_path: str, chunk_size=CHUNK_SIZE_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+    return extract_chunks_from_pages((pdf_path, 0, n_pages), chunk_size, overlap)
+
+def page_tasks(files, pages_per_task=PAGES_PER_TASK):
+    """Split every PDF into (pdf_path, start, stop) page ranges so big files spread across workers."""
+    tasks = []
+    for p in files:
+        with fitz.open(str(p)) as doc:
+            n_pages = len(doc)
+        for start in range(0, n_pages, pages_per_task):
+            tasks.append((str(p), start, min(start + pages_per_task, n_pages)))
+    return tasks
+
 def main():
     files = list(PDF_DIR.glob("*.pdf"))
     if not files:
         print("No PDFs in", PDF_DIR)
         return
+    tasks = page_tasks(files)
+    print(f"Processing {len(files)} PDFs as {len(tasks)} page-range tasks on {EXTRACT_WORKERS} workers")
+    # each worker runs its own tesseract; keep tesseract single-threaded to avoid oversubscription
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    per_file = {}
     # overwrite output
-    with OUT_FILE.open("w", encoding="utf-8") as fout:
+    with OUT_FILE.open("wb") as fout, ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as ex:
         total = 0
-        for p in files:
-            print("Processing", p.name)
-            chunks = extract_chunks_from_pdf_mupdf(str(p))
+        # map() yields in task order, so chunks.jsonl keeps file/page order
+        for task, chunks in zip(tasks, ex.map(extract_chunks_from_pages, tasks)):
             for c in chunks:
-                fout.write(json.dumps(c, ensure_ascii=False) + "\n")
-            print(f"  extracted {len(chunks)} chunks")
+                fout.write(orjson.dumps(c, option=orjson.OPT_APPEND_NEWLINE))
+            name = Path(task[0]).name
+            per_file[name] = per_file.get(name, 0) + len(chunks)
             total += len(chunks)
+    for name, n in per_file.items():
+        print(f"  {name}: extracted {n} chunks")
     print("Wrote", OUT_FILE, "total chunks:", total)
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+# faiss_index.py
+"""
+Builds an in-process FAISS HNSW index from the embeddings produced by embed_texts.py,
+so app.py can search locally instead of calling Pinecone (VECTOR_BACKEND=faiss).
+
+Reads embeddings.npy + ids.jsonl (or embeddings.jsonl if those are missing) and writes:
+  corpus.hnsw         FAISS IndexHNSWFlat, inner product on L2-normalized vectors (= cosine)
+  corpus_meta.jsonl   one {"id": ..., "metadata": {...}} line per index row
+"""
+
+import os
+import numpy as np
+import orjson
+import faiss
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDINGS_FILE = "embeddings.jsonl"
+EMBEDDINGS_NPY = "embeddings.npy"
+IDS_FILE = "ids.jsonl"
+FAISS_INDEX_FILE = os.getenv("FAISS_INDEX_FILE", "corpus.hnsw")
+FAISS_META_FILE = os.getenv("FAISS_META_FILE", "corpus_meta.jsonl")
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+
+def load_embeddings():
+    """Return (ids, metas, float32 matrix) from the npy pair, else from embeddings.jsonl."""
+    ids, metas = [], []
+    if os.path.exists(EMBEDDINGS_NPY) and os.path.exists(IDS_FILE):
+        print(f"Loading {EMBEDDINGS_NPY} + {IDS_FILE}")
+        embs = np.load(EMBEDDINGS_NPY).astype(np.float32)
+        with open(IDS_FILE, "rb") as f:
+            for line in f:
+                if not line.strip(): continue
+                obj = orjson.loads(line)
+                ids.append(obj["id"])
+                metas.append(obj.get("metadata", {}))
+        if len(ids) != embs.shape[0]:
+            raise RuntimeError(f"{IDS_FILE} has {len(ids)} rows but {EMBEDDINGS_NPY} has {embs.shape[0]}")
+        return ids, metas, embs
+
+    print(f"Loading {EMBEDDINGS_FILE}")
+    rows = []
+    with open(EMBEDDINGS_FILE, "rb") as f:
+        for line in f:
+            if not line.strip(): continue
+            obj = orjson.loads(line)
+            ids.append(obj["id"])
+            rows.append(obj["embedding"])
+            metas.append(obj.get("metadata", {}))
+    if not rows:
+        raise RuntimeError("No embeddings found in file")
+    return ids, metas, np.asarray(rows, dtype=np.float32)
+
+def main():
+    ids, metas, embs = load_embeddings()
+    n, dim = embs.shape
+    print(f"Building HNSW index: {n} vectors, dim={dim}, M={HNSW_M}")
+
+    embs = np.ascontiguousarray(embs)
+    faiss.normalize_L2(embs)
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(embs)
+
+    faiss.write_index(index, FAISS_INDEX_FILE)
+    with open(FAISS_META_FILE, "wb") as f:
+        for vid, meta in zip(ids, metas):
+            f.write(orjson.dumps({"id": vid, "metadata": meta}, option=orjson.OPT_APPEND_NEWLINE))
+
+    print("Wrote", FAISS_INDEX_FILE, "and", FAISS_META_FILE)
+
+if __name__ == "__main__":
+    main()
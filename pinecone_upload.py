@@ -1,5 +1,8 @@
 # upload_pinecone_safe.py
-import os, json, time
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import orjson
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 from tqdm import tqdm
@@ -10,16 +13,58 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 INDEX_NAME = os.getenv("PINECONE_INDEX", "medibot-rag")
 EMBEDDINGS_FILE = "embeddings.jsonl"
+EMBEDDINGS_NPY = "embeddings.npy"  # preferred: N x dim float32 matrix from embed_texts.py
+IDS_FILE = "ids.jsonl"             # row-aligned {"id", "metadata"} sidecar for EMBEDDINGS_NPY
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "100"))
-
-def detect_dim(path):
-    with open(path, "r", encoding="utf-8") as f:
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "8"))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def load_embeddings():
+    """
+    Return (ids, metas, embs). Uses embeddings.npy + ids.jsonl when present
+    (embs is a read-only memmap, rows are sliced on demand); otherwise falls
+    back to parsing embeddings.jsonl (embs is a list of lists).
+    """
+    ids, metas = [], []
+    if os.path.exists(EMBEDDINGS_NPY) and os.path.exists(IDS_FILE):
+        print(f"Loading {EMBEDDINGS_NPY} (mmap) + {IDS_FILE}")
+        embs = np.load(EMBEDDINGS_NPY, mmap_mode="r")
+        with open(IDS_FILE, "rb") as f:
+            for line in f:
+                if not line.strip(): continue
+                obj = orjson.loads(line)
+                ids.append(obj["id"])
+                metas.append(obj.get("metadata", {}))
+        if len(ids) != embs.shape[0]:
+            raise RuntimeError(f"{IDS_FILE} has {len(ids)} rows but {EMBEDDINGS_NPY} has {embs.shape[0]}")
+        return ids, metas, embs
+
+    print(f"Loading {EMBEDDINGS_FILE}")
+    embs = []
+    with open(EMBEDDINGS_FILE, "rb") as f:
         for line in f:
             if not line.strip(): continue
-            obj = json.loads(line)
-            return len(obj["embedding"])
+            obj = orjson.loads(line)
+            ids.append(obj["id"])
+            embs.append(obj["embedding"])
+            metas.append(obj.get("metadata", {}))
+    return ids, metas, embs
+
+def detect_dim(embs):
+    if isinstance(embs, np.ndarray):
+        return int(embs.shape[1])
+    if embs:
+        return len(embs[0])
     raise RuntimeError("No embeddings found in file")
 
+def build_batch(ids, metas, embs, start):
+    stop = min(start + BATCH_SIZE, len(ids))
+    rows = embs[start:stop]
+    if isinstance(rows, np.ndarray):
+        rows = np.asarray(rows, dtype=np.float32).tolist()
+    return [{"id": ids[j], "values": rows[j - start], "metadata": metas[j]} for j in range(start, stop)]
+
 def get_existing_indexes(pc):
     try:
         # new SDK returns an object with .names()
@@ -62,8 +107,34 @@ def try_get_index_dimension(pc, index_name):
         pass
     return None
 
+def error_status(e):
+    # Pinecone SDK exceptions expose .status; HTTP-level ones .status_code
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+def upsert_with_retry(index, vectors):
+    """Upsert one batch, retrying rate-limit / server errors with exponential backoff."""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return index.upsert(vectors=vectors)
+        except Exception as e:
+            status = error_status(e)
+            if status is not None and status not in RETRY_STATUSES:
+                raise
+            if attempt >= MAX_RETRIES:
+                raise
+            backoff = 2 ** attempt
+            print(f"[pinecone] upsert failed (status={status}), retrying in {backoff}s...")
+            time.sleep(backoff)
+
 def main():
-    dim = detect_dim(EMBEDDINGS_FILE)
+    ids, metas, embs = load_embeddings()
+    dim = detect_dim(embs)
     print("Detected embedding dimension:", dim)
 
     pc = Pinecone(api_key=PINECONE_API_KEY)
@@ -105,18 +176,12 @@ def main():
     index = pc.Index(target_index)
     print("Uploading vectors to index:", target_index)
 
-    items = []
-    with open(EMBEDDINGS_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip(): continue
-            obj = json.loads(line)
-            items.append((obj["id"], obj["embedding"], obj.get("metadata", {})))
-
-    print("Total vectors to upload:", len(items))
-    for i in tqdm(range(0, len(items), BATCH_SIZE), desc="Upserting"):
-        batch = items[i:i+BATCH_SIZE]
-        vectors = [{"id": vid, "values": emb, "metadata": meta} for vid, emb, meta in batch]
-        index.upsert(vectors=vectors)
+    print("Total vectors to upload:", len(ids))
+    starts = list(range(0, len(ids), BATCH_SIZE))
+    # upserts are network-bound; keep several batches in flight at once.
+    # Each worker slices its own rows so only in-flight batches are materialized.
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as ex:
+        list(tqdm(ex.map(lambda i: upsert_with_retry(index, build_batch(ids, metas, embs, i)), starts), total=len(starts), desc="Upserting"))
 
     print("Upload finished to index:", target_index)
     if target_index != INDEX_NAME: